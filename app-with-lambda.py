@@ -1,9 +1,25 @@
 import streamlit as st
 import requests
-import uuid
-import json
-from datetime import datetime
+import sqlite3
+import gzip
+import codecs
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import time
 import os
+
+# orjson encodes and parses the agent payloads noticeably faster; fall back to the stdlib if it isn't installed.
+try:
+    from orjson import dumps as json_dumps, loads as json_loads, JSONDecodeError
+except ImportError:
+    import json
+    from json import loads as json_loads, JSONDecodeError
+
+    def json_dumps(obj):
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
  
 # ------------------------------
 # Configuration
@@ -11,44 +27,423 @@ import os
 USERNAME = os.getenv('USERNAME')  
 PASSWORD = os.getenv('PASSWORD')
 API_URL = os.getenv('API_URL')
+CHAT_DB_PATH = os.getenv('CHAT_DB_PATH', 'chat.db')
+# Gzip request bodies at least this large (e.g. 1024); 0 disables it. Only enable once
+# request decompression (minimumCompressionSize) is turned on for the API Gateway stage.
+API_GZIP_MIN_SIZE = int(os.getenv('API_GZIP_MIN_SIZE', '0'))
+CHAT_MEMORY_LIMIT = 200  # messages kept in memory per session; the full history lives in SQLite
+HISTORY_PAGE_SIZE = 30  # messages rendered at once; "Show earlier messages" widens the window by this much
+
+# Page layout for the chat UI
+_PAGE_CFG = dict(page_title="Product Search", layout="wide", initial_sidebar_state="expanded")
+
+# Newlines arrive escaped as a literal backslash-n and are rendered as markdown hard breaks
+ESCAPED_NEWLINE = '\\n'
+MARKDOWN_LINE_BREAK = '  \n'
+
+# ------------------------------
+# Styles
+# ------------------------------
+# Colors and fonts come from the [theme] section in .streamlit/config.toml;
+# these rules only cover what the theme cannot express.
+_CSS = """
+<style>
+/* Title smaller with San Francisco font */
+h1 {
+    font-size: 2.5em !important;
+    font-family: -apple-system, BlinkMacSystemFont, "SF Pro Display", "San Francisco", "Segoe UI", Roboto, sans-serif !important;
+}
+   
+/* Main chat container - reduce top padding to move title up */
+.main .block-container {
+    padding-top: 0.5rem;
+    padding-bottom: 5rem; /* Space for chat input */
+}
+   
+/* Sidebar Styling - Black */
+[data-testid="stSidebar"] {
+    background-color: #000000; /* Black sidebar */
+    border-right: 1px solid #333333;
+    padding: 1.5rem;
+}
+   
+/* Sidebar text color - Grey */
+[data-testid="stSidebar"] * {
+    color: #cccccc !important;
+}
+   
+/* Sidebar headings */
+[data-testid="stSidebar"] h1,
+[data-testid="stSidebar"] h2,
+[data-testid="stSidebar"] h3 {
+    color: #e0e0e0 !important;
+}
+   
+/* Sidebar markdown text */
+[data-testid="stSidebar"] .stMarkdown {
+    color: #cccccc !important;
+}
+   
+/* Messages are wrapped in keyed containers (st-key-chat-msg--<role>-<n>),
+   so roles are matched by class instead of :has() */
+
+/* Chat bubble styling - rounded and right aligned for user messages only */
+[class*="st-key-chat-msg--user"] [data-testid="stChatMessage"] {
+    background-color: #f8f9fa; /* Light gray chat bubbles */
+    border: 1px solid #e9ecef;
+    border-radius: 30px;
+    box-shadow: none;
+    padding: 0.75rem 1rem;
+    margin-bottom: 0.5rem;
+    margin-left: auto;
+    max-width: 80%;
+    display: flex;
+    justify-content: flex-end;
+}
+   
+/* Assistant messages: no bubble */
+[class*="st-key-chat-msg--assistant"] [data-testid="stChatMessage"] {
+    background-color: transparent !important;
+    border: none !important;
+    border-radius: 0 !important;
+    padding: 0 !important;
+    margin-bottom: 1rem !important;
+}
+   
+/* Avatar styling - circular black */
+.stAvatar {
+    border-radius: 50% !important;
+    background-color: rgba(0,0,0,0.1) !important;
+}
+   
+/* Style for messages */
+[data-testid="stChatMessage"] p {
+     margin: 0;
+     color: #333333;
+     line-height: 1.5;
+}
+ 
+/* Sample queries bubble styling */
+.sample-queries-bubble {
+    background-color: #f8f9fa;
+    border: 1px solid #e9ecef;
+    border-radius: 30px;
+    padding: 1.5rem;
+    font-size: 0.9em;
+    opacity: 0.8;
+    text-align: left;
+    max-width: 600px;
+    margin: 0 auto 2rem auto;
+}
+   
+/* Hide avatar for sample queries */
+.hide-avatar .stAvatar {
+    display: none !important;
+}
+   
+.hide-avatar [data-testid="stChatMessage"] {
+    padding-left: 0 !important;
+}
+   
+/* Sidebar title smaller */
+[data-testid="stSidebar"] h1 {
+    font-size: 1.5em !important;
+}
+   
+/* Sidebar headings - reduce size */
+[data-testid="stSidebar"] h2 {
+    font-size: 1.2em !important;
+    margin-bottom: 0.5rem !important;
+}
+   
+[data-testid="stSidebar"] h3 {
+    font-size: 1em !important;
+    margin-bottom: 0.5rem !important;
+}
+   
+/* Sidebar paragraphs - smaller font */
+[data-testid="stSidebar"] p {
+    font-size: 0.85em !important;
+}
+   
+/* Add spacing between sections */
+[data-testid="stSidebar"] .section-gap {
+    margin-top: 2.5rem !important;
+    margin-bottom: 1rem !important;
+}
+ 
+/* Button Styling - Grey */
+div.stButton > button {
+    background-color: #e9ecef; /* Grey */
+    color: #333333 !important;
+    border: none;
+    border-radius: 30px;
+    padding: 0.5rem 1rem;
+    font-weight: 500;
+    transition: all 0.2s ease-in-out;
+}
+div.stButton > button:hover {
+    background-color: #d3d6d9; /* Darker grey */
+    color: #333333 !important;
+    box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+}
+   
+/* Sidebar buttons - Grey with no red hover */
+[data-testid="stSidebar"] div.stButton > button {
+    background-color: #333333; /* Dark grey */
+    color: #cccccc !important;
+    border: 1px solid #555555;
+}
+[data-testid="stSidebar"] div.stButton > button:hover {
+    background-color: #444444; /* Lighter grey */
+    color: #cccccc !important;
+}
+ 
+/* Input text color and rounded borders */
+ .stTextInput, .stTextArea, .stChatInput {
+    color: #333333;
+}
+.stTextInput input, .stTextArea textarea, .stChatInput input {
+    color: #333333;
+    background-color: #ffffff;
+    border-radius: 30px !important;
+}
+   
+/* Selectbox rounded */
+.stSelectbox > div > div {
+    border-radius: 30px !important;
+}
+   
+/* Sidebar selectbox styling */
+[data-testid="stSidebar"] .stSelectbox > div > div {
+    background-color: #333333 !important;
+    color: #cccccc !important;
+    border-color: #555555 !important;
+}
+   
+[data-testid="stSidebar"] .stSelectbox label {
+    color: #cccccc !important;
+}
+   
+/* Info box rounded */
+.stInfo {
+    border-radius: 30px !important;
+}
+   
+/* Sidebar info box styling */
+[data-testid="stSidebar"] .stInfo {
+    background-color: #1a1a1a !important;
+    border-color: #555555 !important;
+    color: #cccccc !important;
+}
+</style>
+"""
+
+_SAMPLE_HTML = """
+<div class="sample-queries-bubble">
+<strong>Here are some sample queries to get started:</strong><br><br>
+• Are there emergency lights available in stock?<br>
+• What is the price of IC sensors and how many units are available?
+</div>
+"""
 
 # ------------------------------
 # Helper Functions
 # ------------------------------
-def call_bedrock_agent(user_input, session_id):
+@st.cache_resource
+def get_session():
+    """
+    Returns a pooled HTTP session shared across reruns, so each chat turn reuses
+    the open Keep-Alive connection to API Gateway instead of a new TLS handshake.
+    Failed connections, throttling and unavailable responses are retried with exponential
+    backoff, so only terminal failures reach the user. The agent call is not idempotent, so
+    nothing is retried once the request may have reached it (read timeouts, 502, 504).
+    """
+    session = requests.Session()
+    retry = Retry(
+        total=3,
+        connect=3,
+        read=0,
+        backoff_factor=0.3,
+        status_forcelist=(429, 503),
+        allowed_methods=frozenset(["POST"]),
+        respect_retry_after_header=True,
+        raise_on_status=False  # hand the last response to raise_for_status for a clear error
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=4, pool_maxsize=10)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Content-Type": "application/json"})
+    return session
+
+def parse_agent_response(content, session_id):
     """
-    Sends user input to the API Gateway endpoint and returns the agent's response.
+    Parses a complete JSON response from the API Gateway endpoint.
     This version handles potential nested JSON responses from API Gateway/Lambda.
     """
-    headers = {"Content-Type": "application/json"}
-    payload = {"user_input": user_input, "session_id": session_id}
+    try:
+        data = json_loads(content)
+    except JSONDecodeError:
+        st.error("Failed to decode the JSON response from API Gateway.")
+        return "Error: Invalid response format.", session_id
+ 
+    # API Gateway/Lambda can sometimes wrap the actual response in a 'body' field.
+    # Only a string body needs a second parse; a top-level or already-decoded
+    # object is used as is.
+    body = data.get("body", data)
+    if isinstance(body, str):
+        try:
+            inner_data = json_loads(body)
+        except JSONDecodeError:
+            st.error("Failed to decode the nested JSON response from API Gateway.")
+            return "Error: Invalid response format.", session_id
+    else:
+        inner_data = body
+       
+    # The Lambda escapes newlines; turn them into markdown line breaks once, here,
+    # so the stored history renders as-is with plain st.markdown.
+    response_text = inner_data.get("response", "No response content received.").replace(ESCAPED_NEWLINE, MARKDOWN_LINE_BREAK)
+    return response_text, inner_data.get("session_id", session_id)
+
+def encode_agent_request(user_input, session_id):
+    """
+    Encode the request body once to bytes, gzipping large bodies when enabled. Returns the body and
+    any extra headers; the session already sends the JSON Content-Type. Responses need no handling
+    here, since requests asks for and transparently decompresses gzip (and brotli, when installed).
+    """
+    body = json_dumps({"user_input": user_input, "session_id": session_id})
+    if API_GZIP_MIN_SIZE and len(body) >= API_GZIP_MIN_SIZE:
+        return gzip.compress(body), {"Content-Encoding": "gzip"}
+    return body, {}
+
+def is_plain_text_response(response, first_chunk):
+    """
+    Tells a plain-text reply (e.g. from a Lambda Function URL with RESPONSE_STREAM) apart from
+    a JSON payload. Only text/plain that does not start with a JSON object counts as plain text;
+    any other or missing content type is treated as JSON, as API Gateway does not always label it.
+    """
+    content_type = response.headers.get("Content-Type", "")
+    return content_type.startswith("text/plain") and not first_chunk.lstrip().startswith(b"{")
+
+def text_encoding(response):
+    """The charset declared by the response, defaulting to UTF-8 rather than requests' ISO-8859-1."""
+    return response.encoding if "charset" in response.headers.get("Content-Type", "") else "utf-8"
+
+def call_bedrock_agent(user_input, session_id):
+    """
+    Sends user input to the API Gateway endpoint and yields the agent's response for st.write_stream.
+    A plain-text streaming reply is relayed chunk by chunk as it arrives; a JSON response is parsed
+    and yielded in one piece.
+    """
+    body, headers = encode_agent_request(user_input, session_id)
  
     try:
-        response = requests.post(API_URL, json=payload, headers=headers, timeout=45)
-        response.raise_for_status()
-        data = response.json()
- 
-        # API Gateway/Lambda can sometimes wrap the actual response in a 'body' field.
-        # This logic checks for that and parses the inner JSON string if it exists.
-        if "body" in data:
-            try:
-                inner_data = json.loads(data["body"])
-            except json.JSONDecodeError:
-                st.error("Failed to decode the nested JSON response from API Gateway.")
-                return "Error: Invalid response format.", session_id
-        else:
-            inner_data = data
-           
-        return inner_data.get("response", "No response content received."), inner_data.get("session_id", session_id)
+        with get_session().post(API_URL, data=body, headers=headers, stream=True, timeout=(5, 45)) as response:
+            response.raise_for_status()
+            chunks = response.iter_content(chunk_size=None)
+            first_chunk = next(chunks, b"")
+            if not is_plain_text_response(response, first_chunk):
+                response_text, _ = parse_agent_response(first_chunk + b"".join(chunks), session_id)
+                yield response_text
+                return
+ 
+            decoder = codecs.getincrementaldecoder(text_encoding(response))(errors="replace")
+            for chunk in chain([first_chunk], chunks):
+                text = decoder.decode(chunk)
+                if text:
+                    yield text
+            if tail := decoder.decode(b"", final=True):
+                yield tail
  
     except requests.exceptions.RequestException as e:
         st.error(f"API Call Error: {e}")
-        return "Sorry, I'm having trouble connecting to the service.", session_id
+        yield "Sorry, I'm having trouble connecting to the service."
+ 
+def call_bedrock_agent_batch(prompts):
+    """
+    Sends several independent prompts to the API Gateway endpoint concurrently and returns
+    the agent's responses in the same order. Meant for fan-out features such as follow-up
+    suggestions, where calling the agent one prompt at a time would add up the latencies.
+    Each prompt runs in its own fresh agent session, so the calls cannot conflict with each
+    other and stay out of the user's conversation memory.
+    """
+    session = get_session()
+    session_ids = [new_session_id() for _ in prompts]
+ 
+    def post(user_input, session_id):
+        body, headers = encode_agent_request(user_input, session_id)
+        response = session.post(API_URL, data=body, headers=headers, timeout=(5, 45))
+        response.raise_for_status()
+        return response
  
+    # The pooled session keeps up to 10 connections open, so cap the workers to match
+    with ThreadPoolExecutor(max_workers=max(1, min(len(prompts), 10))) as pool:
+        futures = [pool.submit(post, prompt, session_id) for prompt, session_id in zip(prompts, session_ids)]
+ 
+    # Same content-type handling as call_bedrock_agent, applied to the complete body
+    responses = []
+    for future, session_id in zip(futures, session_ids):
+        try:
+            response = future.result()
+            if is_plain_text_response(response, response.content):
+                response_text = response.content.decode(text_encoding(response), errors="replace")
+            else:
+                response_text, _ = parse_agent_response(response.content, session_id)
+        except requests.exceptions.RequestException as e:
+            st.error(f"API Call Error: {e}")
+            response_text = "Sorry, I'm having trouble connecting to the service."
+        responses.append(response_text)
+    return responses
+
+@st.cache_resource
+def get_db():
+    """
+    Returns the SQLite connection holding the full chat history, shared across reruns.
+    It runs in autocommit mode so every message is written as soon as it is saved.
+    """
+    db = sqlite3.connect(CHAT_DB_PATH, check_same_thread=False, isolation_level=None)
+    db.execute("CREATE TABLE IF NOT EXISTS messages (session_id TEXT, ts REAL, role TEXT, content TEXT)")
+    db.execute("CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id)")
+    return db
+
+def load_history(session_id):
+    """Load the most recent messages of a session from SQLite into a bounded deque."""
+    rows = get_db().execute(
+        "SELECT rowid, role, content FROM messages WHERE session_id = ? ORDER BY rowid DESC LIMIT ?",
+        (session_id, CHAT_MEMORY_LIMIT)
+    ).fetchall()
+    return deque(
+        ({"id": rowid, "role": role, "content": content} for rowid, role, content in reversed(rows)),
+        maxlen=CHAT_MEMORY_LIMIT
+    )
+
+def save_message(session_id, role, content):
+    """
+    Persist a message to SQLite and add it to the session's in-memory history.
+    Returns the message id (its SQLite rowid), which stays the same across reruns.
+    """
+    # RETURNING reads the id in the same statement; lastrowid on the shared connection
+    # could already belong to another browser session's insert
+    (message_id,) = get_db().execute(
+        "INSERT INTO messages (session_id, ts, role, content) VALUES (?, ?, ?, ?) RETURNING rowid",
+        (session_id, time.time(), role, content)
+    ).fetchone()
+    st.session_state.chat_memory[session_id].append({"id": message_id, "role": role, "content": content})
+    return message_id
+
+def new_session_id():
+    """Generate a unique session id from a per-browser counter and the current time."""
+    st.session_state.setdefault("_sid_counter", 0)
+    st.session_state._sid_counter += 1
+    return f"s{st.session_state._sid_counter}-{time.time_ns():x}"
+
 def make_friendly_name():
-    """Generate a human-readable name for a new session using the current timestamp."""
-    timestamp = datetime.now().strftime("%b %d, %H:%M")
-    return f"Chat {len(st.session_state.get('previous_sessions', [])) + 1} – {timestamp}"
+    """
+    Generate a human-readable name for a new session using the running chat number and current timestamp.
+    Only called from the New Chat button, so the counter is set up lazily on the first click.
+    """
+    timestamp = time.strftime("%b %d, %H:%M")
+    return f"Chat {st.session_state.setdefault('_next_chat_n', 2)} – {timestamp}"  # "Current Chat" is the first one
  
  
 # ------------------------------
@@ -71,230 +466,77 @@ def login_page():
 # ------------------------------
 # Streamlit UI
 # ------------------------------
-def chat_ui():
-    st.set_page_config(
-        page_title="Product Search",
-        layout="wide",
-        initial_sidebar_state="expanded"
-    )
+def chat_message(role, tag):
+    """
+    Open a chat message inside a container keyed by role, which the CSS styles by class.
+    Keying on the message id rather than its position keeps each message's container
+    identity stable across reruns, even as the history window slides.
+    """
+    with st.container(key=f"chat-msg--{role}-{tag}"):
+        return st.chat_message(role)
+
+def show_earlier_messages():
+    """Widen the rendered history window by one page; runs before the rerun it triggers."""
+    st.session_state.history_window = st.session_state.get("history_window", HISTORY_PAGE_SIZE) + HISTORY_PAGE_SIZE
+
+def render_history(session_id):
+    """
+    Display the most recent past chat messages from memory. Not a fragment: the turn drawn
+    after it lives outside, so a history-only rerun would show that turn twice.
+    """
+    history = st.session_state.chat_memory[session_id]
+    window = st.session_state.get("history_window", HISTORY_PAGE_SIZE)
  
-    # --- Custom CSS for a light, minimal chat look ---
-    st.markdown("""
-        <style>
-        /* General Body Styling - Light Theme */
-        body {
-            font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, "Helvetica Neue", Arial, sans-serif;
-            background-color: #ffffff;
-            color: #333333;
-        }
-       
-        /* Title smaller with San Francisco font */
-        h1 {
-            font-size: 2.5em !important;
-            font-family: -apple-system, BlinkMacSystemFont, "SF Pro Display", "San Francisco", "Segoe UI", Roboto, sans-serif !important;
-        }
-       
-        /* Main chat container - reduce top padding to move title up */
-        .main .block-container {
-            padding-top: 0.5rem;
-            padding-bottom: 5rem; /* Space for chat input */
-        }
-       
-        /* Ensure main app area has light background */
-        [data-testid="stAppViewContainer"] > .main {
-            background-color: #ffffff;
-        }
- 
-        /* Sidebar Styling - Black */
-        [data-testid="stSidebar"] {
-            background-color: #000000; /* Black sidebar */
-            border-right: 1px solid #333333;
-            padding: 1.5rem;
-        }
-       
-        /* Sidebar text color - Grey */
-        [data-testid="stSidebar"] * {
-            color: #cccccc !important;
-        }
-       
-        /* Sidebar headings */
-        [data-testid="stSidebar"] h1,
-        [data-testid="stSidebar"] h2,
-        [data-testid="stSidebar"] h3 {
-            color: #e0e0e0 !important;
-        }
-       
-        /* Sidebar markdown text */
-        [data-testid="stSidebar"] .stMarkdown {
-            color: #cccccc !important;
-        }
-       
-        /* Chat bubble styling - rounded for user messages only */
-        [data-testid="stChatMessage"][data-testid*="user"] {
-            background-color: #f8f9fa; /* Light gray chat bubbles */
-            border: 1px solid #e9ecef;
-            border-radius: 30px;
-            box-shadow: none;
-            padding: 0.75rem 1rem;
-            margin-bottom: 0.5rem;
-            margin-left: auto;
-            max-width: 80%;
-        }
-       
-        /* User messages right aligned */
-        [data-testid="stChatMessage"]:has([data-testid*="user"]) {
-            display: flex;
-            justify-content: flex-end;
-        }
-       
-        /* Assistant messages: no bubble */
-        [data-testid="stChatMessage"]:has([role="assistant"]) {
-            background-color: transparent !important;
-            border: none !important;
-            border-radius: 0 !important;
-            padding: 0 !important;
-            margin-bottom: 1rem !important;
-        }
-       
-        /* Avatar styling - circular black */
-        .stAvatar {
-            border-radius: 50% !important;
-            background-color: rgba(0,0,0,0.1) !important;
-        }
-       
-        /* Style for messages */
-        [data-testid="stChatMessage"] p {
-             margin: 0;
-             color: #333333;
-             line-height: 1.5;
-        }
- 
-        /* Sample queries bubble styling */
-        .sample-queries-bubble {
-            background-color: #f8f9fa;
-            border: 1px solid #e9ecef;
-            border-radius: 30px;
-            padding: 1.5rem;
-            font-size: 0.9em;
-            opacity: 0.8;
-            text-align: left;
-            max-width: 600px;
-            margin: 0 auto 2rem auto;
-        }
-       
-        /* Hide avatar for sample queries */
-        .hide-avatar .stAvatar {
-            display: none !important;
-        }
-       
-        .hide-avatar [data-testid="stChatMessage"] {
-            padding-left: 0 !important;
-        }
-       
-        /* Sidebar title smaller */
-        [data-testid="stSidebar"] h1 {
-            font-size: 1.5em !important;
-        }
-       
-        /* Sidebar headings - reduce size */
-        [data-testid="stSidebar"] h2 {
-            font-size: 1.2em !important;
-            margin-bottom: 0.5rem !important;
-        }
-       
-        [data-testid="stSidebar"] h3 {
-            font-size: 1em !important;
-            margin-bottom: 0.5rem !important;
-        }
-       
-        /* Sidebar paragraphs - smaller font */
-        [data-testid="stSidebar"] p {
-            font-size: 0.85em !important;
-        }
-       
-        /* Add spacing between sections */
-        [data-testid="stSidebar"] .section-gap {
-            margin-top: 2.5rem !important;
-            margin-bottom: 1rem !important;
-        }
- 
-        /* Button Styling - Grey */
-        div.stButton > button {
-            background-color: #e9ecef; /* Grey */
-            color: #333333 !important;
-            border: none;
-            border-radius: 30px;
-            padding: 0.5rem 1rem;
-            font-weight: 500;
-            transition: all 0.2s ease-in-out;
-        }
-        div.stButton > button:hover {
-            background-color: #d3d6d9; /* Darker grey */
-            color: #333333 !important;
-            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-        }
-       
-        /* Sidebar buttons - Grey with no red hover */
-        [data-testid="stSidebar"] div.stButton > button {
-            background-color: #333333; /* Dark grey */
-            color: #cccccc !important;
-            border: 1px solid #555555;
-        }
-        [data-testid="stSidebar"] div.stButton > button:hover {
-            background-color: #444444; /* Lighter grey */
-            color: #cccccc !important;
-        }
- 
-        /* Title color */
-        h1, h2, h3, h4, h5, h6 {
-            color: #333333 !important;
-        }
- 
-        /* Input text color and rounded borders */
-         .stTextInput, .stTextArea, .stChatInput {
-            color: #333333;
-        }
-        .stTextInput input, .stTextArea textarea, .stChatInput input {
-            color: #333333;
-            background-color: #ffffff;
-            border-radius: 30px !important;
-        }
-       
-        /* Selectbox rounded */
-        .stSelectbox > div > div {
-            border-radius: 30px !important;
-        }
-       
-        /* Sidebar selectbox styling */
-        [data-testid="stSidebar"] .stSelectbox > div > div {
-            background-color: #333333 !important;
-            color: #cccccc !important;
-            border-color: #555555 !important;
-        }
-       
-        [data-testid="stSidebar"] .stSelectbox label {
-            color: #cccccc !important;
-        }
+    # Offer to widen the rendered history window when older messages are hidden
+    if len(history) > window:
+        st.button("Show earlier messages", on_click=show_earlier_messages)
+ 
+    for message in islice(history, max(len(history) - window, 0), None):
+        with chat_message(message["role"], message["id"]):
+            st.markdown(message["content"])
+
+def chat_panel(session_id):
+    """Renders the conversation and handles a new prompt from the chat input."""
+    # Chat input field, pinned to the bottom of the page
+    prompt = st.chat_input("What would you like to ask?")
+ 
+    render_history(session_id)
+ 
+    # Show sample queries if new session; a pending first prompt hides them on this same run
+    if len(st.session_state.chat_memory[session_id]) == 0 and not prompt:
+        st.markdown(_SAMPLE_HTML, unsafe_allow_html=True)
+ 
+    if prompt:
+        # Add user message to session memory
+        message_id = save_message(session_id, "user", prompt)
        
-        /* Info box rounded */
-        .stInfo {
-            border-radius: 30px !important;
-        }
+        # Display user message in the chat
+        with chat_message("user", message_id):
+            st.markdown(prompt)
+ 
+        # Call the agent and stream its response into a single placeholder; it gets
+        # its message id once saved
+        with chat_message("assistant", "pending"):
+            stream = call_bedrock_agent(prompt, session_id)
+            # Only wait under the spinner for the first chunk, then let the reply stream in
+            with st.spinner("Searching for products..."):
+                first_chunk = next(stream, "")
+            response_text = st.write_stream(chain([first_chunk], stream))
        
-        /* Sidebar info box styling */
-        [data-testid="stSidebar"] .stInfo {
-            background-color: #1a1a1a !important;
-            border-color: #555555 !important;
-            color: #cccccc !important;
-        }
-        </style>
-    """, unsafe_allow_html=True)
+        # Add assistant response to session memory
+        save_message(session_id, "assistant", response_text)
+ 
+def chat_ui():
+    st.set_page_config(**_PAGE_CFG)
+ 
+    # --- Custom CSS for a light, minimal chat look ---
+    st.markdown(_CSS, unsafe_allow_html=True)
  
     # --- Session State Initialization ---
     if "session" not in st.session_state:
-        st.session_state.session = {"id": str(uuid.uuid4()), "name": "Current Chat"}
+        st.session_state.session = {"id": new_session_id(), "name": "Current Chat"}
     if "previous_sessions" not in st.session_state:
-        st.session_state.previous_sessions = []
+        st.session_state.previous_sessions = {}  # session id -> name, oldest first
     if "chat_memory" not in st.session_state:
         st.session_state.chat_memory = {}
  
@@ -308,38 +550,40 @@ def chat_ui():
         st.markdown("### Chat Sessions")
  
         if st.button("New Chat", use_container_width=True):
-            if st.session_state.session not in st.session_state.previous_sessions:
-                st.session_state.previous_sessions.append(st.session_state.session)
-                if len(st.session_state.previous_sessions) > 10: # Limit history
-                    st.session_state.previous_sessions.pop(0)
+            st.session_state.previous_sessions[st.session_state.session["id"]] = st.session_state.session["name"]
+            if len(st.session_state.previous_sessions) > 10: # Limit history
+                evicted_id = next(iter(st.session_state.previous_sessions))
+                st.session_state.previous_sessions.pop(evicted_id)
+                # Drop its messages from memory too; they stay in SQLite
+                st.session_state.chat_memory.pop(evicted_id, None)
            
-            st.session_state.session = {"id": str(uuid.uuid4()), "name": make_friendly_name()}
+            st.session_state.session = {"id": new_session_id(), "name": make_friendly_name()}
+            st.session_state._next_chat_n += 1
+            st.session_state.pop("history_window", None)
             st.success("New chat started!")
             st.rerun()
  
         st.markdown("---")
  
         if st.session_state.previous_sessions:
-            session_names = [s["name"] for s in st.session_state.previous_sessions]
+            name_to_id = {name: sid for sid, name in st.session_state.previous_sessions.items()}
+            session_names = list(name_to_id)
             current_session_name = st.session_state.session["name"]
            
             # Add current session to list if not already there, for selection
             if current_session_name not in session_names:
                 session_names.append(current_session_name)
  
-            try:
-                # Find the index of the current session to set as default in selectbox
-                default_index = session_names.index(current_session_name)
-            except ValueError:
-                default_index = 0
+            # Find the index of the current session to set as default in selectbox
+            default_index = session_names.index(current_session_name)
  
             chosen_name = st.selectbox("Previous Chats", options=session_names, index=default_index)
  
             # Logic to switch session if a different one is chosen
             if chosen_name != current_session_name:
-                # Find the full session object from the list of previous sessions
-                chosen_session = next((s for s in st.session_state.previous_sessions if s["name"] == chosen_name), st.session_state.session)
-                st.session_state.session = chosen_session
+                # Look up the id of the chosen session among the previous sessions
+                st.session_state.session = {"id": name_to_id[chosen_name], "name": chosen_name}
+                st.session_state.pop("history_window", None)
                 st.rerun()
        
         st.info(f"Current: **{st.session_state.session['name']}**")
@@ -350,45 +594,9 @@ def chat_ui():
     # Ensure chat memory exists for the current session
     session_id = st.session_state.session["id"]
     if session_id not in st.session_state.chat_memory:
-        st.session_state.chat_memory[session_id] = []
- 
-    # Display past chat messages from memory
-    for message in st.session_state.chat_memory[session_id]:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
- 
-    # Show sample queries if new session
-    if len(st.session_state.chat_memory[session_id]) == 0:
-        st.markdown("""
-        <div class="sample-queries-bubble">
-        <strong>Here are some sample queries to get started:</strong><br><br>
-        • Are there emergency lights available in stock?<br>
-        • What is the price of IC sensors and how many units are available?
-        </div>
-        """, unsafe_allow_html=True)
- 
-    # Chat input field at the bottom of the page
-    if prompt := st.chat_input("What would you like to ask?"):
-        # Add user message to session memory
-        st.session_state.chat_memory[session_id].append({"role": "user", "content": prompt})
-       
-        # Display user message in the chat
-        with st.chat_message("user"):
-            st.markdown(prompt)
+        st.session_state.chat_memory[session_id] = load_history(session_id)
  
-        # Call the agent and get the response
-        with st.chat_message("assistant"):
-            with st.spinner("Searching for products..."):
-                response_text, _ = call_bedrock_agent(prompt, session_id)
-                # Replace escaped \n with actual line breaks in HTML
-                formatted_response = response_text.replace('\\n', '<br>')
-                st.markdown(formatted_response, unsafe_allow_html=True)
-       
-        # Add assistant response to session memory
-        st.session_state.chat_memory[session_id].append({"role": "assistant", "content": response_text})
-       
-        # Rerun to hide sample queries and refresh the chat display
-        st.rerun()
+    chat_panel(session_id)
  
  
 # ------------------------------